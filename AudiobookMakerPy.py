@@ -3,16 +3,8 @@ class ConversionError(Exception):
     """Raised when there is a problem with audio file conversion."""
     pass
 
-class AudioDurationError(Exception):
-    """Raised when there is a problem getting the duration of an audio file."""
-    pass
-
-class AudioPropertiesError(Exception):
-    """Raised when there is a problem getting the properties of an audio file."""
-    pass
-
-class MetadataError(Exception):
-    """Raised when there is a problem with copying metadata from one file to another."""
+class AudioInfoError(Exception):
+    """Raised when there is a problem getting the duration or properties of an audio file."""
     pass
 
 # Standard library imports
@@ -20,82 +12,317 @@ import sys
 import os
 import subprocess
 import tempfile
-import logging
 import shutil
+import logging
+import argparse
+import contextlib
 import re
+import json
+import hashlib
+import itertools
+import time
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Global variables
-max_cpu_cores = os.cpu_count()  # Number of cores to use for parallel processing, use all available cores by default
-tempdir = None
-
-def atoi(text):
-    """Converts a digit string to an integer, otherwise returns the original string"""
-    return int(text) if text.isdigit() else text
+# Number of cores to use for parallel processing, use all cores this process may run on by default. The affinity mask
+# respects taskset and container CPU limits, cpu_count() reports all cores of the host and can return None
+max_cpu_cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+probe_cache_file = os.path.join(os.path.expanduser('~'), '.cache', 'audiobookmakerpy', 'probe.json')  # Persistent cache of ffprobe results
+probe_cache_version = 5  # Increase whenever the probed properties change, older caches are discarded
+conversion_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'audiobookmakerpy', 'aac')  # Persistent cache of converted files, used with --cache-conversions
+conversion_cache_sample_size = 64 * 1024  # Bytes read from the start and end of a file to fingerprint it
+default_bit_rate = 128000  # Bit rate in bps used for conversion when ffprobe does not report one
+max_aac_bit_rate = 320000  # Highest bit rate in bps used for conversion, lossless and PCM sources report far more
+audio_extensions = frozenset({'.mp3', '.wav', '.m4a', '.flac', '.ogg', '.aac', '.m4b'})  # Lowercase extensions of supported audio files
+mp4_audio_extensions = frozenset({'.m4a', '.m4b'})  # Extensions of supported audio files in an MP4 container
+shm_dir = '/dev/shm'  # RAM-backed file system for the converted files, if available
+ffmpeg_executable = shutil.which('ffmpeg')  # Absolute path of ffmpeg, resolved once instead of searching PATH for every call
+ffprobe_executable = shutil.which('ffprobe')  # Absolute path of ffprobe, None if it is not installed
+ffmpeg_error_trailers = frozenset({'Conversion failed!'})  # Closing lines of ffmpeg that do not name the cause of an error
+natural_keys_pattern = re.compile(r'(\d+)')  # Splits file names into text and digit runs for natural sorting
 
 def natural_keys(text):
-    """Splits the input text at each digit and applies atoi function to each part for natural sorting"""
-    return [atoi(c) for c in re.split(r'(\d+)', text)]
+    """Splits the input text at each digit run and converts the digit parts to integers for natural sorting"""
+    return tuple([int(c) if c.isdigit() else c for c in natural_keys_pattern.split(text)])
+
+@dataclass
+class AudioInfo:
+    """Holds the duration of an audio file and the properties of its first audio stream."""
+    __slots__ = ('duration', 'stream_count', 'codec', 'profile', 'sample_rate', 'channels', 'bit_rate')
+    duration: int       # Duration in milliseconds
+    stream_count: int   # Number of streams in the file, including cover art and chapter tracks
+    codec: str          # Audio codec (e.g., mp3, aac)
+    profile: str        # Codec profile if the codec has one (e.g., LC for AAC), otherwise None
+    sample_rate: int    # Sample rate (e.g., 44100, 48000)
+    channels: int       # Number of channels (e.g., 1 for mono, 2 for stereo)
+    bit_rate: int       # Bit rate (e.g., 128000 for 128 kbps)
+
+def get_error_summary(stderr):
+    """
+    Returns the last lines written by ffmpeg or ffprobe to stderr, which usually state why the command failed.
+
+    ffmpeg ends most failures with a generic 'Conversion failed!' line, the actual cause is on the lines 
+    before it. Such closing lines are skipped and the last two remaining lines are returned.
+
+    Args:
+        stderr (str): The captured stderr of the command.
 
-def get_audio_duration(input_file):
+    Returns:
+        str: The last two non-empty lines of stderr joined by '; ', or a placeholder if nothing was written.
+    """
+    lines = [line.strip() for line in stderr.splitlines() if line.strip() and line.strip() not in ffmpeg_error_trailers]
+    return '; '.join(lines[-2:]) if lines else 'no error output'
+
+def get_audio_info(input_file):
     """
-    Retrieves the duration of the provided audio file.
+    Retrieves the duration and the audio properties of the provided audio file.
 
-    The function uses the ffprobe command to obtain the duration of the audio file. It then returns this duration, 
-    converted from seconds to milliseconds.
+    The function runs a single ffprobe command that reports both the duration and stream count of the 
+    container and the codec, profile, sample rate, channels, and bit rate of the first audio stream as JSON. 
+    The output is parsed once and the duration is converted from seconds to milliseconds.
+
+    Many FLAC, Ogg, and VBR files do not report the bit rate of the stream, or report it as 'N/A'. 
+    default_bit_rate is used for those instead of failing the whole file.
 
     Args:
         input_file (str): The path of the input audio file.
 
     Returns:
-        int: The duration of the audio file in milliseconds.
+        AudioInfo: The duration of the audio file in milliseconds and the properties of its first audio stream.
 
     Raises:
-        AudioDurationError: If there is an error in executing the ffprobe command or parsing its output.
+        AudioInfoError: If there is an error in executing the ffprobe command or parsing its output.
     """
-    logging.info(f'Getting duration for {input_file}')
-    ffprobe_command = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', input_file]
+    logging.info('Getting duration and properties for %s', input_file)
+    ffprobe_command = [ffprobe_executable, '-v', 'error', '-select_streams', 'a:0', '-show_entries', 'format=duration,nb_streams:stream=codec_name,profile,sample_rate,channels,bit_rate', '-of', 'json', input_file]
     try:
-        output = subprocess.check_output(ffprobe_command).decode('utf-8').strip()
-        return int(float(output) * 1000)  # convert duration from seconds to milliseconds
+        # Execute command and parse the JSON output
+        output = subprocess.run(ffprobe_command, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+        info = json.loads(output.decode('utf-8'))
+        stream = info['streams'][0]
+        # Not the container bit rate as fallback, it is unrelated to the audio stream, e.g. it includes cover art
+        bit_rate = int(stream['bit_rate']) if stream.get('bit_rate', '').isdigit() else default_bit_rate
+        return AudioInfo(
+            duration=int(float(info['format']['duration']) * 1000),  # convert duration from seconds to milliseconds
+            stream_count=int(info['format']['nb_streams']),
+            codec=stream['codec_name'],
+            profile=stream.get('profile'),
+            sample_rate=int(stream['sample_rate']),
+            channels=int(stream['channels']),
+            bit_rate=bit_rate,
+        )
     except subprocess.CalledProcessError as e:
-        logging.error(f'Error occurred while getting duration for {input_file}: {str(e)}')
-        raise AudioDurationError(f"Getting duration of {input_file} failed.") from e
+        # Include what ffprobe reported, the exit status alone does not tell why the file could not be read
+        stderr = e.stderr.decode('utf-8', errors='replace')
+        logging.error('Error occurred while getting duration and properties for %s: %s\n%s', input_file, e, stderr.strip())
+        raise AudioInfoError(f"Getting duration and properties of {input_file} failed: {get_error_summary(stderr)}") from e
+    except (ValueError, KeyError, IndexError) as e:
+        logging.error('Error occurred while getting duration and properties for %s: %s', input_file, e)
+        raise AudioInfoError(f"Getting duration and properties of {input_file} failed.") from e
+
+def load_probe_cache():
+    """
+    Loads the persistent cache of ffprobe results from disk.
 
-def get_audio_properties(input_file):
+    The cache maps the absolute path of an audio file to the modification time and size the file had when it 
+    was probed, together with the probed duration and properties. A missing or unreadable cache file, or a 
+    cache written with a different probe_cache_version, results in an empty cache.
+
+    Returns:
+        dict: The probe cache.
     """
-    Extracts the audio properties of the given input file.
+    try:
+        with open(probe_cache_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    The function uses ffprobe command to get information about the audio file, including codec, sample rate, 
-    channels, and bit rate. It then returns these properties in a dictionary.
+    if not isinstance(data, dict) or data.get('version') != probe_cache_version:
+        return {}
+    return data.get('files', {})
+
+def is_probe_cache_entry_current(path, entry):
+    """
+    Checks whether a probe cache entry still describes the file at its path.
 
     Args:
-        input_file (str): The path of the input audio file.
+        path (str): The absolute path of the audio file.
+        entry (dict): The cache entry of the file.
 
     Returns:
-        dict: A dictionary containing the audio properties. The keys are 'codec', 'sample_rate', 'channels', 
-        and 'bit_rate'.
+        bool: True if the file exists and its modification time and size match the entry, False otherwise.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return isinstance(entry, dict) and entry.get('mtime_ns') == stat.st_mtime_ns and entry.get('size') == stat.st_size
 
-    Raises:
-        AudioPropertiesError: If there is an error in executing the ffprobe command or parsing its output.
+def save_probe_cache(probe_cache):
     """
-    logging.info(f'Getting properties for {input_file}')
-    # Define ffprobe command to extract audio properties
-    ffprobe_command = ['ffprobe', '-v', 'error', '-select_streams', 'a:0', '-show_entries', 'stream=codec_name,sample_rate,channels,bit_rate', '-of', 'csv=p=0', input_file]
+    Writes the cache of ffprobe results to disk.
+
+    The entries are merged into the cache currently on disk, so runs that finish in parallel do not drop 
+    each other's results. The cache is written to a temporary file that then replaces the cache file, so 
+    another run never reads a partially written cache. Entries of files that were deleted or changed since 
+    they were probed are dropped, so the cache does not keep growing with every file ever probed.
+
+    Failing to write the cache is not fatal, the files will simply be probed again on the next run.
+
+    Args:
+        probe_cache (dict): The probe cache to save.
+    """
+    merged_cache = load_probe_cache()
+    merged_cache.update(probe_cache)
+    merged_cache = {path: entry for path, entry in merged_cache.items() if is_probe_cache_entry_current(path, entry)}
+
+    temp_file = None
     try:
-        # Execute command and decode output
-        output = subprocess.check_output(ffprobe_command).decode('utf-8').strip().split(',')
-        # Return a dictionary of properties
-        return {
-            'codec': output[0],           # Audio codec (e.g., mp3, aac)
-            'sample_rate': int(output[1]),  # Sample rate (e.g., 44100, 48000)
-            'channels': int(output[2]),    # Number of channels (e.g., 1 for mono, 2 for stereo)
-            'bit_rate': int(output[3]),   # Bit rate (e.g., 128000 for 128 kbps)
-        }
-    except subprocess.CalledProcessError as e:
-        logging.error(f'Error occurred while getting properties for {input_file}: {str(e)}')
-        raise AudioPropertiesError(f"Getting properties of {input_file} failed.") from e
+        cache_dir = os.path.dirname(probe_cache_file)
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=cache_dir, suffix='.tmp', delete=False) as f:
+            temp_file = f.name
+            json.dump({'version': probe_cache_version, 'files': merged_cache}, f)
+        os.replace(temp_file, probe_cache_file)
+    except OSError as e:
+        # Do not leave the partially written cache behind in the cache directory
+        if temp_file is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_file)
+        logging.warning('Could not save probe cache to %s: %s', probe_cache_file, e)
+
+def lookup_probe_cache(probe_cache, input_file):
+    """
+    Looks up the cached duration and properties of an audio file.
+
+    An entry is only used if the modification time and size of the file still match the values recorded 
+    when the file was probed, so changed files are probed again. A file that cannot be stat'ed is treated 
+    as not cached.
+
+    The stat result is returned as well. It is taken before the file is probed, so storing it with the probe 
+    result never records old probe data under the modification time of a file that changed in the meantime.
+
+    Args:
+        probe_cache (dict): The probe cache.
+        input_file (str): The path of the audio file.
+
+    Returns:
+        tuple: The cached duration and properties as AudioInfo, or None if there is no valid entry, and the 
+        os.stat_result of the file, or None if it could not be stat'ed.
+    """
+    entry = probe_cache.get(os.path.abspath(input_file))
+    try:
+        stat = os.stat(input_file)
+    except OSError:
+        # Let ffprobe report the missing or unreadable file through the usual AudioInfoError
+        return None, None
+    if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        return AudioInfo(**entry['info']), stat
+    return None, stat
+
+def update_probe_cache(probe_cache, input_file, stat, audio_info):
+    """
+    Stores the probed duration and properties of an audio file in the probe cache.
+
+    Args:
+        probe_cache (dict): The probe cache.
+        input_file (str): The path of the audio file.
+        stat (os.stat_result): The stat result of the file, taken before it was probed.
+        audio_info (AudioInfo): The duration and properties of the file.
+    """
+    probe_cache[os.path.abspath(input_file)] = {
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'info': asdict(audio_info),
+    }
+
+def get_conversion_cache_file(input_file, bitrate):
+    """
+    Computes the path under which the conversion of an audio file is stored in the conversion cache.
+
+    The file is identified by a fingerprint of its size, modification time, and the first and last 
+    conversion_cache_sample_size bytes, which is cheap to compute even for large files and changes whenever the 
+    file is replaced or edited. The bitrate is part of the fingerprint, so a file converted with a different 
+    bitrate is not mistaken for a cached one.
+
+    Args:
+        input_file (str): The path of the audio file.
+        bitrate (int): The bitrate of the conversion in kbps.
+
+    Returns:
+        str: The path of the cached conversion, or None if the file could not be read.
+    """
+    try:
+        stat = os.stat(input_file)
+        fingerprint = hashlib.blake2b(f'{stat.st_size}:{stat.st_mtime_ns}:{bitrate}'.encode('utf-8'), digest_size=20)
+        with open(input_file, 'rb') as f:
+            fingerprint.update(f.read(conversion_cache_sample_size))
+            if stat.st_size > conversion_cache_sample_size:
+                f.seek(max(conversion_cache_sample_size, stat.st_size - conversion_cache_sample_size))
+                fingerprint.update(f.read())
+    except OSError as e:
+        logging.warning('Could not fingerprint %s for the conversion cache: %s', input_file, e)
+        return None
+
+    return os.path.join(conversion_cache_dir, fingerprint.hexdigest() + '.m4a')
+
+def get_cached_duration_file(cache_file):
+    """Returns the path of the JSON file next to a cached conversion that holds its duration"""
+    return os.path.splitext(cache_file)[0] + '.json'
+
+def load_cached_duration(cache_file):
+    """
+    Reads the duration ffmpeg reported when a file in the conversion cache was converted.
+
+    Args:
+        cache_file (str): The path of the file in the conversion cache.
+
+    Returns:
+        int: The duration of the cached file in milliseconds, or None if it was not stored or cannot be read.
+    """
+    try:
+        with open(get_cached_duration_file(cache_file), 'r', encoding='utf-8') as f:
+            duration = json.load(f)['duration']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return duration if isinstance(duration, int) else None
+
+def store_conversion(converted_file, cache_file, duration):
+    """
+    Copies a converted audio file into the conversion cache, together with its duration.
+
+    The file is copied to a temporary file in the cache directory that then replaces the cache file, so a 
+    parallel run never uses a partially copied file. The duration reported by ffmpeg is written the same way 
+    to a JSON file next to it, so a later run can use the cached file without probing it. Failing to store 
+    the file is not fatal, it will simply be converted again on the next run.
+
+    Args:
+        converted_file (str): The path of the converted audio file.
+        cache_file (str): The path of the file in the conversion cache.
+        duration (int): The duration of the converted file in milliseconds, or None if ffmpeg did not report it.
+    """
+    temp_file = None
+    try:
+        os.makedirs(conversion_cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=conversion_cache_dir, suffix='.tmp', delete=False) as f:
+            temp_file = f.name
+            with open(converted_file, 'rb') as source:
+                shutil.copyfileobj(source, f)
+        os.replace(temp_file, cache_file)
+
+        if duration is not None:
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=conversion_cache_dir, suffix='.tmp', delete=False) as f:
+                temp_file = f.name
+                json.dump({'duration': duration}, f)
+            os.replace(temp_file, get_cached_duration_file(cache_file))
+    except OSError as e:
+        # Remove the partial copy, nothing else ever cleans up the conversion cache
+        if temp_file is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_file)
+        logging.warning('Could not store the conversion of %s in the conversion cache: %s', converted_file, e)
 
 def ms_to_timestamp(ms):
     """
@@ -110,173 +337,402 @@ def ms_to_timestamp(ms):
     Returns:
         str: The time duration in timestamp format ('HH:MM:SS.mmm').
     """
-    # convert milliseconds to timestamp format (HH:MM:SS.mmm)
-    seconds, ms = divmod(ms, 1000)
-    minutes, seconds = divmod(seconds, 60)
-    hours, minutes = divmod(minutes, 60)
-    return f"{hours:02}:{minutes:02}:{seconds:02}.{ms:03}"
+    # convert milliseconds to timestamp format (HH:MM:SS.mmm), splitting off hours and minutes in milliseconds directly
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    return f"{hours:02}:{minutes:02}:{ms // 1000:02}.{ms % 1000:03}"
+
+def is_aac_compatible(audio_info):
+    """
+    Checks whether an audio stream can be copied into the audiobook without re-encoding.
+
+    A stream is compatible if it already has the format convert_to_aac produces: AAC-LC at 44100 Hz in stereo.
+
+    Args:
+        audio_info (AudioInfo): The audio properties as returned by get_audio_info.
+
+    Returns:
+        bool: True if the audio stream can be stream-copied, False if it has to be re-encoded.
+    """
+    return (audio_info.codec == 'aac' and audio_info.profile == 'LC'
+            and audio_info.sample_rate == 44100 and audio_info.channels == 2)
+
+def get_progress_duration(progress_output):
+    """
+    Extracts the duration of the written output from the progress report of ffmpeg.
 
-def convert_to_aac(input_file, output_file, bitrate):
+    With '-progress pipe:1', ffmpeg prints blocks of key=value lines to stdout. The last 'out_time_us' 
+    (or 'out_time_ms' in older versions, which despite its name is also in microseconds) is the time of 
+    the last written audio, which is the duration of the output file.
+
+    Args:
+        progress_output (str): The text ffmpeg wrote to stdout.
+
+    Returns:
+        int: The duration of the output in milliseconds, or None if ffmpeg did not report it.
+    """
+    duration = None
+    for line in progress_output.splitlines():
+        key, _, value = line.partition('=')
+        if key in ('out_time_us', 'out_time_ms') and value.strip().isdigit():
+            duration = int(value) // 1000  # convert microseconds to milliseconds
+    return duration
+
+def can_use_as_is(input_file, audio_info):
+    """
+    Checks whether an audio file can be passed to the concat demuxer without converting or remuxing it.
+
+    This is the case for compatible AAC in an MP4 container that holds nothing but the audio stream. Files 
+    with cover art or chapter tracks are still remuxed, because the concat demuxer expects every file to 
+    have the same streams.
+
+    Args:
+        input_file (str): The path of the audio file.
+        audio_info (AudioInfo): The audio properties as returned by get_audio_info.
+
+    Returns:
+        bool: True if the file can be concatenated as is, False if it has to go through convert_to_aac.
+    """
+    return (is_aac_compatible(audio_info) and audio_info.stream_count == 1
+            and os.path.splitext(input_file)[1].lower() in mp4_audio_extensions)
+
+def get_target_bitrate(input_file, audio_info):
+    """
+    Determines the bitrate for converting an audio file to AAC.
+
+    The bitrate of the source is preserved, but capped at max_aac_bit_rate. Lossless and PCM sources report 
+    their uncompressed bit rate (1411 kbps for CD audio WAV), which would make the AAC encoder run at its 
+    maximum and produce files several times larger than needed.
+
+    The bitrate is also capped at the average bit rate of the whole input file, its size divided by its 
+    duration. Files whose stream does not report a bit rate, such as low bit rate Ogg/Opus, would otherwise 
+    be encoded with default_bit_rate and grow several times larger than the input, and the converted files 
+    could no longer be expected to fit where the input files do (see get_temp_parent_dir).
+
+    Args:
+        input_file (str): The path of the audio file.
+        audio_info (AudioInfo): The duration and properties of the audio file.
+
+    Returns:
+        int: The bitrate for the conversion in kbps.
+    """
+    bit_rate = min(audio_info.bit_rate, max_aac_bit_rate)
+    if audio_info.duration > 0:
+        with contextlib.suppress(OSError):
+            bit_rate = min(bit_rate, os.path.getsize(input_file) * 8 * 1000 // audio_info.duration)
+    return max(bit_rate // 1000, 1)
+
+def convert_to_aac(input_file, output_file, bitrate, stream_copy=False, threads=1):
     """
     Converts the given audio file to AAC format using ffmpeg.
 
     The function prepares and executes a ffmpeg command for converting the input audio file
-    to AAC format with the specified bitrate. If the conversion process encounters an error,
-    the function logs the error, removes the output file if it was created, and raises a 
-    ConversionError exception.
+    to AAC format with the specified bitrate. If the input is already compatible AAC, the audio 
+    stream is copied into the output file instead of being decoded and encoded again. If the 
+    conversion process encounters an error, the function logs the error, removes the output file 
+    if it was created, and raises a ConversionError exception.
+
+    The number of threads ffmpeg uses for decoding and encoding is limited, because several 
+    conversions run in parallel and each would otherwise start a thread per core.
+
+    ffmpeg reports its progress on stdout, from which the duration of the written file is taken. This 
+    is the length the file will have in the audiobook, which can differ slightly from the probed duration 
+    of the input after resampling and re-encoding.
 
     Args:
         input_file (str): The path of the audio file to be converted.
         output_file (str): The path where the converted file will be saved.
         bitrate (int): The bitrate for the converted audio file in kbps.
+        stream_copy (bool): Whether to copy the audio stream as is instead of re-encoding it.
+        threads (int): The number of threads ffmpeg may use for decoding and for encoding.
 
     Returns:
-        str: The path of the converted audio file.
+        tuple: The path of the converted audio file and its duration in milliseconds, or None as duration if 
+        ffmpeg did not report it.
 
     Raises:
         ConversionError: If the conversion process fails.
     """
     # Prepare the command for ffmpeg to convert the input file to AAC format
-    ffmpeg_command = ['ffmpeg', '-i', input_file, '-vn', '-acodec', 'aac', '-b:a', f'{bitrate}k', '-ar', '44100', '-ac', '2', output_file]
+    # ffmpeg reports its progress as key=value lines on stdout instead of the status line on stderr,
+    # and only writes errors to stderr, so parallel conversions do not flood the console
+    if stream_copy:
+        ffmpeg_command = [ffmpeg_executable, '-hide_banner', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1', '-threads', str(threads), '-i', input_file, '-vn', '-acodec', 'copy', output_file]
+    else:
+        ffmpeg_command = [ffmpeg_executable, '-hide_banner', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1', '-threads', str(threads), '-i', input_file, '-vn', '-acodec', 'aac', '-b:a', f'{bitrate}k', '-ar', '44100', '-ac', '2', '-threads', str(threads), output_file]
 
     try:
-        # Run the ffmpeg command
-        subprocess.run(ffmpeg_command, check=True)
+        # Run the ffmpeg command and read the duration of the written file from its progress report
+        # Errors are captured instead of written to the console, where parallel conversions would interleave them
+        result = subprocess.run(ffmpeg_command, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, errors='replace')
 
     except subprocess.CalledProcessError as e:
-        # Log the error if there's an issue with the conversion process
-        logging.error(f'Error occurred while converting {input_file} to AAC: {str(e)}')
+        # Log the error if there's an issue with the conversion process, including the errors reported by ffmpeg
+        logging.error('Error occurred while converting %s to AAC: %s\n%s', input_file, e, e.stderr.strip())
 
-        # Check if the output file was created
-        if os.path.exists(output_file):
-            # If it was created, remove it because the conversion process was not successful
+        # Remove the output file if it was created, because the conversion process was not successful
+        with contextlib.suppress(FileNotFoundError):
             os.remove(output_file)
 
         # Raise an exception to stop the script due to the error
-        raise ConversionError(f"Conversion of {input_file} failed.") from e
+        raise ConversionError(f"Conversion of {input_file} failed: {get_error_summary(e.stderr)}") from e
 
-    return output_file
+    return output_file, get_progress_duration(result.stdout)
 
-def create_metadata_file(tempdir, input_files, durations):
+def create_metadata_file(tempdir, durations):
     """
     Creates a metadata file for chapters based on the durations of the input audio files.
 
     The function generates a metadata file containing chapter timestamps and names.
-    For each input file, it computes the start and end times based on the duration of the audio file,
-    and then writes this information to the metadata file in the format required by MP4Box for chapter information.
+    For each duration, it computes the start and end times of the chapter of that audio file,
+    and then writes this information to the metadata file in the FFMETADATA1 format, which ffmpeg reads 
+    as an input to embed the chapters. The start times of all chapters are also written to the log as one entry.
 
     Args:
         tempdir (str): The directory where the metadata file will be created.
-        input_files (list of str): A list of paths of the input audio files.
         durations (list of int): A list of durations of the input audio files in milliseconds.
 
     Returns:
         str: The path of the created metadata file.
     """
     # Define the path of the metadata file
-    metadata_file = os.path.join(tempdir, 'chapters.txt')
-
-    # Open the metadata file in write mode
-    with open(metadata_file, 'w') as f:
-        # Initialize start time for first chapter
-        start = 0
-        # Loop through each input file and its corresponding duration
-        for i, (_, duration) in enumerate(zip(input_files, durations)):
-                        # Compute the end time for the current chapter
-            end = start + duration
-            # Write the chapter timestamp and name to the metadata file
-            f.write(f'CHAPTER{i+1}={ms_to_timestamp(start)}\nCHAPTER{i+1}NAME=Chapter {i+1}\n')
-            # Update the start time for the next chapter
-            start = end
+    metadata_file = os.path.join(tempdir, 'chapters.ffmetadata')
+
+    # Compute the start time of every chapter, the last value is the end time of the last chapter
+    starts = list(itertools.accumulate(durations, initial=0))
+    # Build the chapter start, end, and name in milliseconds for every input file
+    chapters = [f'[CHAPTER]\nTIMEBASE=1/1000\nSTART={start}\nEND={end}\ntitle=Chapter {i+1}\n'
+                for i, (start, end) in enumerate(zip(starts, starts[1:]))]
+
+    # Write the header that identifies the file as ffmetadata followed by all chapters at once
+    with open(metadata_file, 'w', encoding='utf-8') as f:
+        f.write(';FFMETADATA1\n' + ''.join(chapters))
+
+    # Log all chapter start times as a single entry
+    logging.info('Audiobook with %d chapters:\n%s', len(chapters),
+                 '\n'.join(f'Chapter {i+1} starts at {ms_to_timestamp(start)}' for i, start in enumerate(starts[:-1])))
 
     # Return the path of the metadata file
     return metadata_file
 
-def copy_metadata(input_file, output_file):
-    """Copies metadata from the first input file to the output file.
+def escape_concat_path(path):
+    """
+    Makes a path absolute and escapes it for a single-quoted 'file' directive of the ffmpeg concat demuxer.
+
+    Inside single quotes only the quote itself is special, it is written as '\\'' (close the quote, an escaped 
+    quote, reopen the quote). Backslashes are kept, so Windows paths are passed on unchanged.
 
     Args:
-        input_file (str): Path to the first input audio file.
-        output_file (str): Path to the output audio file.
-        tempdir (str): Path to the temporary directory used for conversion.
-    """
-    # Log the start of the metadata copying process
-    logging.info(f'Copying metadata from {input_file} to {output_file}')
-    
-    # Create a temporary file in the same directory as output_file
-    output_dir = os.path.dirname(output_file)
-    output_temp_file = os.path.join(output_dir, 'temp_' + os.path.basename(output_file))
-
-    # Prepare the command for ffmpeg to copy the metadata
-    ffmpeg_command = ['ffmpeg', '-i', output_file, '-i', input_file, '-map', '0', '-map_metadata', '1', '-c', 'copy', '-y', output_temp_file]
-    
-    try:
-        # Run the ffmpeg command
-        subprocess.run(ffmpeg_command, check=True)
+        path (str): The path of an audio file.
 
-        # Remove the original output file
-        if os.path.exists(output_file):
-            os.remove(output_file)
+    Returns:
+        str: The absolute path with its single quotes escaped.
+    """
+    return os.path.abspath(path).replace("'", "'\\''")
 
-        # Rename the temp output file to the original output file
-        os.rename(output_temp_file, output_file)
+def create_concat_list_file(tempdir, input_files):
+    """
+    Creates a list file for the ffmpeg concat demuxer.
 
-    except subprocess.CalledProcessError as e:
-        # Log the error if there's an issue with the metadata copying process
-        logging.error(f'Error occurred while copying metadata from {input_file} to {output_file}: {str(e)}')
-
-        # Check if the temp output file was created
-        if os.path.exists(output_temp_file):
-            # If it was created, remove it because the metadata copying process was not successful
-            os.remove(output_temp_file)
-        
-        # Raise an exception to stop the script due to the error
-        raise MetadataError(f"Copying metadata from {input_file} to {output_file} failed.") from e
+    The function writes one 'file' directive per input file, in order. The paths are made absolute and 
+    single quotes in them are escaped, as required by the quoting rules of the concat demuxer.
 
-def process_audio_files(input_files, output_file):
-    """Processes audio files, converts them to AAC, creates metadata, and concatenates the files.
+    Args:
+        tempdir (str): The directory where the list file will be created.
+        input_files (list of str): A list of paths of the audio files to concatenate.
+
+    Returns:
+        str: The path of the created list file.
+    """
+    concat_list_file = os.path.join(tempdir, 'concat_list.txt')
+
+    # Build the whole list in memory and write it with a single call
+    escaped_paths = [escape_concat_path(input_file) for input_file in input_files]
+    with open(concat_list_file, 'w', encoding='utf-8') as f:
+        f.write(''.join(f"file '{escaped_path}'\n" for escaped_path in escaped_paths))
+
+    return concat_list_file
+
+def probe_and_convert(input_file, output_file, audio_info=None, threads=1, force_transcode=False, cache_conversions=False):
+    """
+    Probes the given audio file if needed and converts it to AAC.
+
+    Running both steps in one task lets the pool probe one file while it is converting another, instead 
+    of waiting for every file to be probed before the first conversion can start. Files that can be 
+    concatenated as is are not converted at all, and the input file itself is returned. With force_transcode, 
+    every file is re-encoded, including files that are already compatible AAC.
+
+    With cache_conversions, re-encoded files are kept in the conversion cache and reused by later runs, as long 
+    as the input file and the bitrate are unchanged. Stream copies are not cached, they are cheap to repeat.
+
+    Args:
+        input_file (str): The path of the audio file to be converted.
+        output_file (str): The path where the converted file will be saved.
+        audio_info (AudioInfo): The cached duration and properties of the file, or None to probe it with ffprobe.
+        threads (int): The number of threads ffmpeg may use for the conversion.
+        force_transcode (bool): Whether to re-encode the file even if it could be used as is or stream-copied.
+        cache_conversions (bool): Whether to look up and store re-encoded files in the conversion cache.
+
+    Returns:
+        tuple: The path of the converted audio file, its duration in milliseconds, and the AudioInfo of the 
+        input file. The duration is the one reported by ffmpeg for the converted file, or the probed duration 
+        of the input file if ffmpeg did not report one. For a file taken from the conversion cache, it is the 
+        duration ffmpeg reported when the file was converted, or the probed duration of the cached file if that 
+        was not stored.
+    """
+    if audio_info is None:
+        audio_info = get_audio_info(input_file)
+
+    if not force_transcode and can_use_as_is(input_file, audio_info):
+        logging.info('Using %s without conversion', input_file)
+        return input_file, audio_info.duration, audio_info
+
+    stream_copy = not force_transcode and is_aac_compatible(audio_info)
+    bitrate = get_target_bitrate(input_file, audio_info)
+
+    cache_file = None
+    if cache_conversions and not stream_copy:
+        cache_file = get_conversion_cache_file(input_file, bitrate)
+        if cache_file is not None and os.path.isfile(cache_file):
+            logging.info('Using cached conversion of %s', input_file)
+            duration = load_cached_duration(cache_file)
+            if duration is None:
+                duration = get_audio_info(cache_file).duration
+            return cache_file, duration, audio_info
+
+    converted_file, duration = convert_to_aac(input_file, output_file, bitrate, stream_copy, threads)
+    if cache_file is not None:
+        store_conversion(converted_file, cache_file, duration)
+    if duration is None:
+        duration = audio_info.duration
+    return converted_file, duration, audio_info
+
+def get_temp_parent_dir(input_files):
+    """
+    Chooses the directory in which the temporary directory for the converted files is created.
+
+    On systems with a RAM-backed '/dev/shm', the converted files are written there, so they are not 
+    written to disk and read back again for the concatenation. get_target_bitrate never encodes above the 
+    average bit rate of an input file, so the converted files are at most about as large as the input files. 
+    '/dev/shm' is only used if it has room for twice their total size, leaving memory for everything else.
 
     Args:
         input_files (list): List of paths to input audio files.
-        output_file (str): Path to output audio file.
 
     Returns:
-        str: Path to the temporary directory used for conversion.
+        str: The path of '/dev/shm', or None to use the default temporary directory of the system.
     """
-    global tempdir
+    if not os.path.isdir(shm_dir):
+        return None
 
-    durations = []
-    audio_properties = []
-    
-    for f in input_files:
-        duration = get_audio_duration(f)
-        properties = get_audio_properties(f)
+    try:
+        required_space = 2 * sum(os.path.getsize(input_file) for input_file in input_files)
+        if shutil.disk_usage(shm_dir).free > required_space:
+            return shm_dir
+    except OSError as e:
+        logging.warning('Could not check the free space in %s: %s', shm_dir, e)
+
+    return None
+
+def process_audio_files(input_files, output_file, jobs=max_cpu_cores, ffmpeg_threads=1, force_transcode=False, cache_conversions=False):
+    """Processes audio files, converts them to AAC, creates metadata, and concatenates the files.
+
+    The metadata of the first input file is copied to the output file by the same ffmpeg call that 
+    concatenates the files, so the output file is only written once.
 
-        durations.append(duration)
-        audio_properties.append(properties)
+    The ffprobe and ffmpeg calls for the individual files are independent of each other, so every file is 
+    probed and converted by its own task in a thread pool. The threads only wait for the ffprobe and ffmpeg 
+    processes, so they do not compete for the GIL, and probing of one file overlaps with the conversion of 
+    others.
 
-    tempdir = tempfile.mkdtemp()
+    The probe results of the files that were processed are saved to the probe cache, also when another file 
+    fails.
+
+    The intermediate files are written to a temporary directory that is removed when the function returns, 
+    including when an error occurs. The directory is created in '/dev/shm' when it has enough free space.
+
+    Args:
+        input_files (list): List of paths to input audio files.
+        output_file (str): Path to output audio file.
+        jobs (int): Number of files to probe and convert at the same time.
+        ffmpeg_threads (int): Number of threads each ffmpeg conversion may use.
+        force_transcode (bool): Whether to re-encode every file, even those that are already compatible AAC.
+        cache_conversions (bool): Whether to reuse and store re-encoded files in the persistent conversion cache.
+    """
+    # Files in the probe cache skip ffprobe entirely
+    probe_cache = load_probe_cache()
 
     try:
-        with ProcessPoolExecutor(max_workers=max_cpu_cores) as executor:
-            # Log the start of the conversion process
-            logging.info(f'Converting {len(input_files)} files to AAC')
-            # Define a list of future tasks for conversion
-            future_tasks = [executor.submit(convert_to_aac, input_file, os.path.join(tempdir, os.path.splitext(os.path.basename(input_file))[0] + '_converted.m4a'), properties['bit_rate'] // 1000)
-                            for input_file, properties in zip(input_files, audio_properties)]
-            # Update the input files with the results of the tasks
-            input_files = [future.result() for future in future_tasks]
-
-        logging.info('Creating metadata file')
-        metadata_file = create_metadata_file(tempdir, input_files, durations)
-
-        logging.info(f'Concatenating {len(input_files)} files')
-        mp4box_concat_command = ['MP4Box', '-force-cat', '-chap', metadata_file] + [arg for f in input_files for arg in ['-cat', f]] + [output_file]
-        subprocess.run(mp4box_concat_command, check=True)
-
-    except ConversionError as e:
-        logging.error(f'A conversion error occurred: {str(e)}')
-        shutil.rmtree(tempdir)
+        with tempfile.TemporaryDirectory(prefix='abmpy_', dir=get_temp_parent_dir(input_files)) as tempdir:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                # Log the start of the conversion process
+                logging.info('Probing and converting %d files to AAC', len(input_files))
+                # Compute the paths of the converted files once, before the tasks are submitted
+                # The index keeps the names unique when input files from different directories share a name
+                output_paths = [os.path.join(tempdir, f'{i:04d}_{os.path.splitext(os.path.basename(input_file))[0]}_converted.m4a')
+                                for i, input_file in enumerate(input_files)]
+                # Look up every file in the probe cache, the stat taken here is stored with a new probe result
+                cache_lookups = [lookup_probe_cache(probe_cache, input_file) for input_file in input_files]
+                # Map the future tasks for probing and conversion to the index of their input file
+                future_tasks = {executor.submit(probe_and_convert, input_file, output_path, cached_info, ffmpeg_threads, force_transcode, cache_conversions): i
+                                for i, (input_file, output_path, (cached_info, _)) in enumerate(zip(input_files, output_paths, cache_lookups))}
+                # Collect the results as the tasks finish, stored at the original position of their input file
+                results = [None] * len(input_files)
+                last_progress_time = 0.0
+                progress_printed = False
+                try:
+                    for completed, future in enumerate(as_completed(future_tasks), start=1):
+                        i = future_tasks[future]
+                        results[i] = future.result()
+                        logging.info('Converted %s (%d/%d)', input_files[i], completed, len(input_files))
+                        # Rewrite a single progress line at most once per second, and always for the last file
+                        now = time.monotonic()
+                        if now - last_progress_time >= 1 or completed == len(input_files):
+                            sys.stdout.write(f'\rConverted {completed}/{len(input_files)} files')
+                            sys.stdout.flush()
+                            last_progress_time = now
+                            progress_printed = True
+                except (AudioInfoError, ConversionError):
+                    # Do not start the remaining tasks once one file has failed
+                    for future in future_tasks:
+                        future.cancel()
+                    raise
+                finally:
+                    # End the progress line, also when a file failed, so later output starts on a new line
+                    if progress_printed:
+                        sys.stdout.write('\n')
+                    # Cache the files that were probed successfully, also when another file failed,
+                    # so a rerun after fixing that file does not probe all the others again
+                    for input_file, (_, stat), result in zip(input_files, cache_lookups, results):
+                        if result is not None and stat is not None:
+                            update_probe_cache(probe_cache, input_file, stat, result[2])
+                    save_probe_cache(probe_cache)
+
+            # Keep the input files untouched, the first one is still needed as the source of the metadata
+            converted_files = [converted_file for converted_file, _, _ in results]
+            durations = [duration for _, duration, _ in results]
+
+            logging.info('Creating metadata file')
+            metadata_file = create_metadata_file(tempdir, durations)
+
+            logging.info('Concatenating %d files and copying metadata from %s', len(converted_files), input_files[0])
+            concat_list_file = create_concat_list_file(tempdir, converted_files)
+            # Stream-copy the converted files into the output file, add the chapters from the metadata file
+            # and copy the global metadata of the first input file
+            ffmpeg_concat_command = [ffmpeg_executable, '-hide_banner', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', concat_list_file, '-i', metadata_file, '-i', input_files[0],
+                                     '-map', '0:a', '-map_chapters', '1', '-map_metadata', '2', '-c', 'copy', '-movflags', '+faststart', '-y', output_file]
+            try:
+                subprocess.run(ffmpeg_concat_command, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, errors='replace')
+            except subprocess.CalledProcessError as e:
+                logging.error('Error occurred while concatenating the files into %s: %s\n%s', output_file, e, e.stderr.strip())
+                raise ConversionError(f"Concatenation into {output_file} failed: {get_error_summary(e.stderr)}") from e
+
+            logging.info('Removing temporary directory - %s', tempdir)
+
+    except (AudioInfoError, ConversionError) as e:
+        logging.error('An error occurred while processing the audio files: %s', e)
+        # ffmpeg and ffprobe no longer write to the console, so report the error there as well
+        print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
 def setup_logging():
@@ -298,33 +754,68 @@ def parse_arguments():
     Parses and validates command line arguments for the application.
 
     This function expects at least one argument (excluding the script name itself), which should 
-    be a path to an input file or directory. Multiple paths can be passed. If no arguments are 
-    provided or the provided arguments are invalid, an error message is logged, usage instructions 
-    are printed to the console, and the program exits with status code 1.
+    be a path to an input file or directory. Multiple paths can be passed. The optional '--jobs' 
+    argument sets the number of files that are probed and converted in parallel and '--ffmpeg-threads' 
+    the number of threads each of these ffmpeg processes may use. '--force-transcode' re-encodes every 
+    file, even those that are already compatible AAC, and '--cache-conversions' keeps re-encoded files 
+    for later runs. If no input paths are provided or the provided arguments are invalid, usage 
+    instructions are printed to the console and the program exits.
 
     Returns:
-        list: The list of command line arguments (excluding the script name), which are the paths 
-        to input files or directories.
+        argparse.Namespace: The parsed arguments, 'input_paths' holds the paths to input files or 
+        directories, 'jobs' the number of files processed in parallel, 'ffmpeg_threads' the number of 
+        threads per ffmpeg process, 'force_transcode' whether every file is re-encoded, and 
+        'cache_conversions' whether the conversion cache is used.
     """
-    if len(sys.argv) < 2:
-        print("Usage: python AudiobookMakerPy.py <input_path> [<input_path2> <input_path3> ...]")
-        logging.error("Invalid number of input paths")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Concatenates audio files into a single .m4b audiobook with chapters.')
+    parser.add_argument('input_paths', nargs='+', metavar='input_path', help='Audio file or directory containing audio files.')
+    parser.add_argument('--jobs', type=int, default=max_cpu_cores, help=f'Number of files to process in parallel (default: {max_cpu_cores}).')
+    parser.add_argument('--ffmpeg-threads', type=int, default=1, help='Number of threads each ffmpeg conversion may use (default: 1). '
+                        'Keep --jobs times --ffmpeg-threads at or below the number of cores.')
+    parser.add_argument('--force-transcode', action='store_true', help='Re-encode every file, even those that are already AAC '
+                        'at 44.1 kHz stereo and would otherwise be copied without re-encoding.')
+    parser.add_argument('--cache-conversions', action='store_true', help='Keep re-encoded files in '
+                        f'{conversion_cache_dir} and reuse them when the same files are processed again.')
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        logging.error('Invalid number of jobs: %d', args.jobs)
+        parser.error('--jobs must be at least 1')
+    if args.ffmpeg_threads < 1:
+        logging.error('Invalid number of ffmpeg threads: %d', args.ffmpeg_threads)
+        parser.error('--ffmpeg-threads must be at least 1')
+
+    return args
+
+def check_executables():
+    """
+    Checks that ffmpeg and ffprobe were found on the PATH.
 
-    return sys.argv[1:]
+    Both executables are resolved once when the script starts. Checking them before any file is processed 
+    gives a clear message instead of a failure in the middle of the conversion.
+
+    Raises:
+        SystemExit: If ffmpeg or ffprobe is not installed or not on the PATH.
+    """
+    for name, executable in (('ffmpeg', ffmpeg_executable), ('ffprobe', ffprobe_executable)):
+        if executable is None:
+            logging.error('%s was not found on the PATH', name)
+            print(f"{name} was not found. Install FFmpeg and make sure {name} is on the PATH.")
+            sys.exit(1)
 
 def validate_and_get_input_files(input_paths):
     """
     Validates and retrieves all valid audio files from the provided input paths.
 
     This function takes as input a list of paths. Each path can either be a directory or a file.
-    If it is a directory, the function retrieves all audio files (with extensions: '.mp3', '.wav', '.m4a', 
-    '.flac', '.ogg', '.aac', '.m4b') in the directory. If it is a file, the function adds the file to the 
+    If it is a directory, the function scans it and retrieves all audio files (with extensions: '.mp3', '.wav', 
+    '.m4a', '.flac', '.ogg', '.aac', '.m4b') in the directory. If it is a file, the function adds the file to the 
     list of input files, given it has a valid audio extension. The function then sorts the list of input 
     files using a natural key sorting algorithm.
 
     If a provided path is neither a directory nor a file, or does not have a valid audio extension, 
-    the function prints an error message and the program exits with status code 1.
+    or no audio files are found at all, the function prints an error message and the program exits 
+    with status code 1.
 
     Args:
         input_paths (list): A list of paths to directories or files.
@@ -333,20 +824,29 @@ def validate_and_get_input_files(input_paths):
         list: A sorted list of valid audio files from the provided paths.
 
     Raises:
-        SystemExit: If a path is neither a directory nor a file, or if a file does not have a valid audio extension.
+        SystemExit: If a path is neither a directory nor a file, if a file does not have a valid audio extension, 
+        or if no audio files are found.
     """
     input_files = []
     for input_path in input_paths:
         if os.path.isdir(input_path):
-            folder_path = input_path
-            folder_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.lower().endswith(('.mp3', '.wav', '.m4a', '.flac', '.ogg', '.aac', '.m4b'))]
+            # The directory entries returned by scandir already know whether they are files
+            with os.scandir(input_path) as entries:
+                folder_files = [entry.path for entry in entries if entry.is_file() and os.path.splitext(entry.name)[1].lower() in audio_extensions]
             input_files.extend(folder_files)
         elif os.path.isfile(input_path):
+            if os.path.splitext(input_path)[1].lower() not in audio_extensions:
+                print(f"Unsupported audio file: {input_path}")
+                sys.exit(1)
             input_files.append(input_path)
         else:
             print(f"Invalid input path: {input_path}")
             sys.exit(1)
 
+    if not input_files:
+        print("No audio files found in the input paths.")
+        sys.exit(1)
+
     input_files.sort(key=natural_keys)
     return input_files
 
@@ -358,41 +858,57 @@ def get_output_file(input_files):
     in the list of input files and appending the base name of this directory with the '.m4b' 
     extension. This output file path is intended to be used for saving the audiobook file.
 
+    The path of the first file is made absolute first, so a file given relative to the current directory 
+    still names the audiobook after that directory instead of producing a file named '.m4b'.
+
     Args:
         input_files (list): A list of file paths to the input audio files.
 
     Returns:
         str: The output file path for the audiobook.
     """
-    folder_path = os.path.dirname(input_files[0])
+    folder_path = os.path.dirname(os.path.abspath(input_files[0]))
     output_name = os.path.basename(folder_path) + '.m4b'
     return os.path.join(folder_path, output_name)
 
-def cleanup_tempdir():
+def exclude_output_file(input_files, output_file):
     """
-    Removes the temporary directory used during audiobook creation process.
+    Removes the output file from the list of input files.
 
-    This function logs the removal of the temporary directory and then proceeds
-    to delete it using the shutil.rmtree method.
+    The audiobook is written to the directory of the input files, and '.m4b' is a supported input extension, 
+    so a second run on the same directory would pick up the audiobook of the previous run as an input. As a 
+    compatible M4B file it would be concatenated as is, from the same file that the concat call overwrites.
 
-    Note:
-        This function assumes that the 'tempdir' variable is globally accessible and 
-        contains the path to the temporary directory. It is expected to be called after 
-        all operations needing the temporary directory have been completed.
+    Args:
+        input_files (list): A list of file paths to the input audio files.
+        output_file (str): The output file path for the audiobook.
+
+    Returns:
+        list: The input files without the output file.
+
+    Raises:
+        SystemExit: If the output file was the only input file.
     """
-    logging.info(f'Removing temporary directory - {tempdir}')
-    shutil.rmtree(tempdir)
+    output_path = os.path.normcase(os.path.abspath(output_file))
+    remaining_files = [input_file for input_file in input_files if os.path.normcase(os.path.abspath(input_file)) != output_path]
+
+    if len(remaining_files) < len(input_files):
+        logging.info('Skipping %s, it is the output file of a previous run', output_file)
+    if not remaining_files:
+        print(f"No audio files found besides the output file {output_file}.")
+        sys.exit(1)
+
+    return remaining_files
 
 if __name__ == '__main__':
     setup_logging()
 
-    input_paths = parse_arguments()
-    input_files = validate_and_get_input_files(input_paths)
+    args = parse_arguments()
+    check_executables()
+    input_files = validate_and_get_input_files(args.input_paths)
     output_file = get_output_file(input_files)
+    input_files = exclude_output_file(input_files, output_file)
 
-    process_audio_files(input_files, output_file)
-    copy_metadata(input_files[0], output_file)
-
-    cleanup_tempdir()
+    process_audio_files(input_files, output_file, args.jobs, args.ffmpeg_threads, args.force_transcode, args.cache_conversions)
 
     logging.info('Audiobook creation complete.')
\ No newline at end of file